@@ -0,0 +1,444 @@
+# Test de charge de l'application Streamlit (app.py)
+#
+# Simule N sessions simultanées avec AppTest : chaque session remplit le
+# formulaire, ajoute des produits avec photo, ouvre l'historique et génère
+# le document. Pour chaque niveau de concurrence on mesure les latences
+# (p50/p95/p99) des reruns et du rendu PDF, le taux d'erreurs, les factures
+# perdues dans invoices.json, ainsi que la consommation CPU/mémoire.
+#
+# Attention : AppTest n'est pas thread-safe (Runtime global), chaque session
+# tourne donc dans son propre processus avec son propre interpréteur. Un vrai
+# serveur `streamlit run` exécute toutes les sessions comme des threads d'un
+# seul processus, en concurrence pour le GIL et le runtime. Les latences
+# mesurées ici sous-estiment donc cette file d'attente et surestiment la
+# capacité réelle d'une instance ; les conflits sur invoices.json et
+# product_images, partagés entre les sessions, sont en revanche bien réels.
+#
+# La photo du premier produit de chaque document s'appelle toujours
+# photo.png, comme depuis un téléphone : save_image l'enregistre sous
+# product_images/photo.png pour toutes les sessions. Chaque photo a une
+# couleur propre à sa session, ce qui permet de compter celles écrasées
+# par une autre session au moment de la génération.
+#
+# Utilisation :
+#   python load_test.py --sessions 1 5 10 20 --iterations 3
+#
+# Le test s'exécute dans un dossier temporaire : le fichier invoices.json
+# et le dossier product_images du projet ne sont jamais modifiés.
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import os.path
+import queue as queue_module
+import shutil
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image as PILImage
+from streamlit.testing.v1 import AppTest
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+APP_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'app.py'))
+SEED_INVOICES = os.path.abspath(os.path.join(os.path.dirname(__file__), 'invoices.json'))
+
+
+def percentile(values, pct):
+    # Percentile par rang le plus proche
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(max(1, math.ceil(pct / 100 * len(ordered))), len(ordered))
+    return ordered[rank - 1]
+
+
+def format_ms(value):
+    return "   n/a" if value is None else f"{value * 1000:6.0f}"
+
+
+def format_mb(value):
+    return "n/a" if value is None else f"{value / 1024:.0f}"
+
+
+def get_widget(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"Widget introuvable : {label}")
+
+
+def photo_color(session_id, iteration, idx):
+    # Couleur unie identifiant la photo (conservée par le redimensionnement)
+    return session_id % 256, iteration % 256, idx % 256
+
+
+def make_photo(color):
+    # Photo PNG générée en mémoire, comme un fichier envoyé par l'utilisateur
+    buffer = BytesIO()
+    PILImage.new('RGB', (800, 600), color=color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def photo_is_ours(image_path, color):
+    if not image_path or not os.path.exists(image_path):
+        return False
+    try:
+        with PILImage.open(image_path) as image:
+            return image.convert('RGB').getpixel((0, 0)) == color
+    except OSError:
+        return False
+
+
+def cpu_time():
+    if resource is None:
+        return None
+    # Sessions terminées uniquement : à lire une fois les processus rejoints
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def process_rss(pid):
+    # RSS courant en Ko, lu dans /proc (Linux uniquement)
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def operations_per_session(args):
+    # Par document, au pire : rerun d'une page fraîche, reset, formulaire,
+    # adresse, 3 reruns par produit, historique, génération et rendu PDF seul
+    return args.iterations * (7 + 3 * args.products)
+
+
+def new_stats():
+    return {
+        'reruns': [], 'generations': [], 'renders': [],
+        'errors': [], 'written': [], 'attempts': 0, 'failed': 0,
+        'photos': 0, 'overwritten': 0
+    }
+
+
+def merge_stats(total, stats):
+    for key, values in stats.items():
+        total[key] += values
+
+
+class OperationError(Exception):
+    # Échec d'une opération mesurée (rerun ou rendu PDF)
+    pass
+
+
+def timed_run(at, stats, bucket, timeout):
+    stats['attempts'] += 1
+    start = time.perf_counter()
+    try:
+        at.run(timeout=timeout)
+    except Exception as e:
+        raise OperationError(f"{type(e).__name__}: {e}") from e
+    stats[bucket].append(time.perf_counter() - start)
+    if at.exception:
+        raise OperationError(f"{at.exception[0].proto.type}: {at.exception[0].message}")
+    return at
+
+
+def run_document(app, at, stats, level, session_id, iteration, args):
+    numero = f"LT{level}-{session_id}-{iteration}"
+    document_type = "DEVIS" if iteration % 2 else "FACTURE"
+
+    # Repartir d'un document vide : exactement --products produits par document
+    get_widget(at.button, "Reset").click()
+    timed_run(at, stats, 'reruns', args.timeout)
+
+    # Formulaire client
+    get_widget(at.radio, "Type de document").set_value(document_type)
+    get_widget(at.text_input, "Numéro facture").input(numero)
+    get_widget(at.text_input, "Nom du client").input(f"Client {session_id}")
+    get_widget(at.text_input, "Adresse client").input("1 rue du Test, 71000 Mâcon")
+    get_widget(at.text_input, "Téléphone client").input("0600000000")
+    get_widget(at.text_input, "Email client").input(f"client{session_id}@example.com")
+    get_widget(at.radio, "Choisir le mode de livraison").set_value('livraison')
+    timed_run(at, stats, 'reruns', args.timeout)
+    get_widget(at.text_area, "Adresse de livraison").input("2 rue de la Livraison\n71680 Crêches")
+    timed_run(at, stats, 'reruns', args.timeout)
+
+    # Produits avec photo, envoyée par le vrai st.file_uploader : main() la
+    # repasse ensuite dans save_image à chaque rerun tant qu'elle est attachée.
+    for idx in range(args.products):
+        get_widget(at.button, "Ajouter un produit").click()
+        timed_run(at, stats, 'reruns', args.timeout)
+        at.text_area(key=f"presta_{idx}").input(f"Meuble {idx}\nChêne massif")
+        at.number_input(key=f"prix_{idx}").set_value(100.0 + idx)
+        at.number_input(key=f"qte_{idx}").set_value(float(idx % 3 + 1))
+        timed_run(at, stats, 'reruns', args.timeout)
+
+        photo_name = "photo.png" if idx == 0 else f"lt_{level}_{session_id}_{iteration}_{idx}.png"
+        photo = make_photo(photo_color(session_id, iteration, idx))
+        at.file_uploader(key=f"photo_{idx}").upload(photo_name, photo, 'image/png')
+        timed_run(at, stats, 'reruns', args.timeout)
+
+    # Historique
+    get_widget(at.button, "Historique").click()
+    timed_run(at, stats, 'reruns', args.timeout)
+
+    # Génération du document (save_invoice + create_pdf)
+    get_widget(at.button, "Générer la facture").click()
+    timed_run(at, stats, 'generations', args.timeout)
+    stats['written'].append(numero)
+
+    # Photos écrasées ou supprimées par une autre session
+    for idx, service in enumerate(at.session_state['services']):
+        stats['photos'] += 1
+        if not photo_is_ours(service.get('image_path'), photo_color(session_id, iteration, idx)):
+            stats['overwritten'] += 1
+
+    # Rendu PDF seul, hors rerun, avec les mêmes données que main()
+    services = at.session_state['services']
+    remise = get_widget(at.number_input, "Remise (€)").value
+    total_ttc = sum(service['prix_total'] for service in services) - remise
+    data = {
+        'numero': numero,
+        'client_nom': f"Client {session_id}",
+        'adresse_client': "1 rue du Test, 71000 Mâcon",
+        'telephone_client': "0600000000",
+        'client_email': f"client{session_id}@example.com",
+        'services': services,
+        'mode_livraison': 'livraison',
+        'adresse_livraison': "2 rue de la Livraison\n71680 Crêches",
+        'remise': remise,
+        'document_type': document_type
+    }
+    stats['attempts'] += 1
+    start = time.perf_counter()
+    try:
+        app.create_pdf(data, total_ttc)
+    except Exception as e:
+        raise OperationError(f"{type(e).__name__}: {e}") from e
+    stats['renders'].append(time.perf_counter() - start)
+
+
+def run_session(workdir, level, session_id, args, barrier, queue):
+    # Une session = un processus, tous partageant le même dossier et donc
+    # le même invoices.json (voir l'avertissement en tête de fichier).
+    stats = new_stats()
+    try:
+        try:
+            os.chdir(workdir)
+            import app
+        finally:
+            # Toujours atteindre la barrière pour ne pas bloquer les autres sessions
+            barrier.wait(timeout=args.timeout)
+
+        at = None
+        for iteration in range(args.iterations):
+            # Une erreur n'arrête que le document en cours ; la session
+            # repart d'une page fraîchement chargée pour le suivant.
+            try:
+                if at is None:
+                    at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+                    timed_run(at, stats, 'reruns', args.timeout)
+                run_document(app, at, stats, level, session_id, iteration, args)
+            except OperationError as e:
+                stats['failed'] += 1
+                stats['errors'].append(f"session {session_id}, document {iteration}: {e}")
+                at = None
+            except Exception as e:
+                # Pas une opération mesurée (widget absent...) : hors taux d'erreurs
+                stats['errors'].append(f"session {session_id}, document {iteration} (hors opération): {type(e).__name__}: {e}")
+                at = None
+    except Exception as e:
+        stats['errors'].append(f"session {session_id} (hors opération): {type(e).__name__}: {e}")
+    finally:
+        queue.put(stats)
+
+
+def count_lost(invoices_path, expected):
+    try:
+        with open(invoices_path, 'r', encoding='utf-8') as f:
+            present = {inv['numero'] for inv in json.load(f)}
+    except (OSError, ValueError) as e:
+        return len(expected), f"invoices.json illisible ({type(e).__name__})"
+    return len(expected - present), None
+
+
+def run_level(workdir, level, args, seed_numbers):
+    # Chaque niveau repart de l'historique initial
+    invoices_path = os.path.join(workdir, 'invoices.json')
+    if args.seed and os.path.exists(SEED_INVOICES):
+        shutil.copyfile(SEED_INVOICES, invoices_path)
+    elif os.path.exists(invoices_path):
+        os.remove(invoices_path)
+
+    barrier = multiprocessing.Barrier(level)
+    queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_session, args=(workdir, level, i, args, barrier, queue))
+        for i in range(level)
+    ]
+
+    # Pire cas : chaque opération atteint le délai maximum
+    deadline = time.perf_counter() + args.timeout * (operations_per_session(args) + 1)
+    cpu_before = cpu_time()
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+
+    stats = new_stats()
+    received = 0
+    rss_total = rss_session = None
+    while received < level:
+        # Mémoire des sessions en cours : somme et plus gros processus
+        samples = [rss for rss in (process_rss(p.pid) for p in processes if p.is_alive()) if rss]
+        if samples:
+            rss_total = max(rss_total or 0, sum(samples))
+            rss_session = max(rss_session or 0, max(samples))
+
+        try:
+            merge_stats(stats, queue.get(timeout=0.2))
+            received += 1
+            continue
+        except queue_module.Empty:
+            pass
+
+        if not any(p.is_alive() for p in processes):
+            # Récupérer les derniers résultats encore dans le tube
+            try:
+                while received < level:
+                    merge_stats(stats, queue.get(timeout=1))
+                    received += 1
+            except queue_module.Empty:
+                pass
+            break
+        if time.perf_counter() > deadline:
+            for process in processes:
+                process.terminate()
+            break
+
+    for process in processes:
+        process.join()
+    wall = time.perf_counter() - start
+    cpu_after = cpu_time()
+
+    # Sessions sans résultat : processus planté ou interrompu
+    exit_codes = [process.exitcode for process in processes if process.exitcode]
+    sessions_lost = level - received
+    if sessions_lost:
+        stats['errors'].append(
+            f"{sessions_lost} session(s) sans résultat (codes de sortie : {exit_codes or 'aucun'})"
+        )
+
+    expected = set(stats['written']) | (seed_numbers if args.seed else set())
+    lost, file_error = count_lost(invoices_path, expected)
+
+    return {
+        'sessions': level,
+        'rerun': stats['reruns'] + stats['generations'],
+        'generate': stats['generations'],
+        'render': stats['renders'],
+        'error_rate': stats['failed'] / stats['attempts'] if stats['attempts'] else 0.0,
+        'errors': stats['errors'],
+        'sessions_lost': sessions_lost,
+        'invoices_error': file_error,
+        'lost': lost,
+        'loss_rate': lost / len(expected) if expected else 0.0,
+        'overwrite_rate': stats['overwritten'] / stats['photos'] if stats['photos'] else 0.0,
+        'cpu': (cpu_after - cpu_before) / wall * 100 if cpu_after is not None else None,
+        'rss_total': rss_total,
+        'rss_session': rss_session,
+    }
+
+
+def print_report(results):
+    header = (
+        f"{'sess':>4} | {'rerun p50/p95/p99 (ms)':>24} | {'générer p50/p95/p99 (ms)':>24} | "
+        f"{'pdf p50/p95/p99 (ms)':>24} | {'erreurs':>7} | {'perdues':>7} | {'photos':>7} | {'CPU %':>6} | "
+        f"{'RSS Mo':>7} | {'RSS/sess':>8}"
+    )
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        cols = []
+        for key in ('rerun', 'generate', 'render'):
+            cols.append('/'.join(format_ms(percentile(r[key], p)) for p in (50, 95, 99)))
+        cpu = "n/a" if r['cpu'] is None else f"{r['cpu']:.0f}"
+        loss = "illis." if r['invoices_error'] else f"{r['loss_rate']:.1%}"
+        print(
+            f"{r['sessions']:>4} | {cols[0]:>24} | {cols[1]:>24} | {cols[2]:>24} | "
+            f"{r['error_rate']:>7.1%} | {loss:>7} | {r['overwrite_rate']:>7.1%} | {cpu:>6} | "
+            f"{format_mb(r['rss_total']):>7} | {format_mb(r['rss_session']):>8}"
+        )
+    for r in results:
+        if r['invoices_error']:
+            print(f"[{r['sessions']} sessions] {r['invoices_error']}")
+        for error in r['errors'][:5]:
+            print(f"[{r['sessions']} sessions] {error}")
+        if len(r['errors']) > 5:
+            print(f"[{r['sessions']} sessions] ... {len(r['errors']) - 5} autres erreurs")
+    print("erreurs = opérations en échec / opérations tentées (reruns et rendus PDF) ;")
+    print("les erreurs hors opération et les sessions sans résultat sont listées à part.")
+    print("perdues = factures absentes de invoices.json en fin de niveau ; illis. = fichier illisible.")
+    print("photos = photos écrasées ou perdues au moment de la génération / photos des documents générés.")
+    print("CPU % = temps CPU des sessions / durée du niveau (100 = un cœur).")
+    print("RSS Mo = pic de la somme des sessions du niveau ; RSS/sess = pic de la plus grosse session.")
+    print("Une session = un processus : ces chiffres surestiment la capacité d'un seul")
+    print("serveur `streamlit run`, où toutes les sessions partagent un processus et le GIL.")
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"doit être un entier supérieur ou égal à 1 : {value}")
+    return number
+
+
+def positive_float(value):
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"doit être strictement positif : {value}")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge de l'application de facturation")
+    parser.add_argument('--sessions', type=positive_int, nargs='+', default=[1, 5, 10, 20],
+                        help="Niveaux de concurrence à tester")
+    parser.add_argument('--iterations', type=positive_int, default=3,
+                        help="Documents générés par session")
+    parser.add_argument('--products', type=positive_int, default=2,
+                        help="Produits (avec photo) de chaque document")
+    parser.add_argument('--timeout', type=positive_float, default=60,
+                        help="Délai maximum d'un rerun (secondes)")
+    parser.add_argument('--no-seed', dest='seed', action='store_false',
+                        help="Démarrer avec un historique vide")
+    args = parser.parse_args()
+
+    seed_numbers = set()
+    if os.path.exists(SEED_INVOICES):
+        with open(SEED_INVOICES, 'r', encoding='utf-8') as f:
+            seed_numbers = {inv['numero'] for inv in json.load(f)}
+
+    workdir = tempfile.mkdtemp(prefix='facture_load_test_')
+    try:
+        results = []
+        for level in args.sessions:
+            print(f"{level} session(s) simultanée(s)...", flush=True)
+            results.append(run_level(workdir, level, args, seed_numbers))
+        print()
+        print_report(results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()